@@ -15,234 +15,657 @@ Description:
 """
 
 #Import math
+import json
 import math
-import pprint
+import os
+import sys
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+
+import numpy as np
+
+#drone_kernel is the fleet pricing kernel compiled ahead of time by drone_kernel_build.py.
+#If it hasn't been built the fleet is priced by make_pricer instead (see calculate_drone_premiums)
+try:
+    import drone_kernel
+except ImportError:
+    drone_kernel = None
+
+#numba is optional. If it is installed the scalar ILF functions are compiled,
+#otherwise they run as plain python. When drone_kernel is built numba isn't needed at
+#runtime, so it isn't imported and nothing is compiled (or loaded from the cache) at import
+njit = None
+if drone_kernel is None:
+    try:
+        from numba import guvectorize, njit, prange
+    except ImportError:
+        njit = None
+
+
+def _jit(signature):
+    """
+    Compile a pure numeric function with numba when it is available.
+    
+    Parameters:
+    signature = numba type signature for the function
+    """
+    if njit is None:
+        return lambda func: func
+    return njit(signature, cache=True, fastmath=True)
+
+#JAX is an optional backend for batch re-rating in price_fleets. It is slow to import so it
+#is only used when the HYPEREXPON_JAX environment variable is set to 1
+USE_JAX = os.environ.get("HYPEREXPON_JAX") == "1"
 
 #structing code the same way it will be in the .py file
 
-#define input data structure
-def get_example_data():
+#define the drone record. Using slots keeps each drone small and makes attribute
+#access quicker than looking up string keys in a dictionary
+@dataclass(slots=True)
+class Drone:
     """
-    Return an example data structure containing the inputs and placeholder outputs for the drone pricing model
+    A drone's inputs and the premiums calculated for it by the model.
     """
-    example_data = {
-        "insured": "Drones R Us",
-        "underwriter": "Michael",
-        "broker": "AON",
-        "brokerage": 0.3,
-        "max_drones_in_air": 2,
-        "drones": [
-            {
-                "serial_number": "AAA-111",
-                "value": 10000,
-                "weight": "0 - 5kg",
-                "has_detachable_camera": True,
-                "tpl_limit": 1000000, #set tpl_limit to its numerical value as this is an input variable
-                "tpl_excess": 0, #set tpl_excess to its numerical value as this is an input variable
-                "hull_base_rate": None,
-                "hull_weight_adjustment": None,
-                "hull_final_rate": None,
-                "hull_premium": None,
-                "tpl_base_rate": None,
-                "tpl_base_layer_premium": None,
-                "tpl_ilf": None,
-                "tpl_layer_premium": None
-            },
-            {
-                "serial_number": "BBB-222",
-                "value": 12000,
-                "weight": "10 - 20kg",
-                "has_detachable_camera": False,
-                "tpl_limit": 4000000, #set tpl_limit to its numerical value as this is an input variable
-                "tpl_excess": 1000000, #set tpl_excess to its numerical value as this is an input variable
-                "hull_base_rate": None,
-                "hull_weight_adjustment": None,
-                "hull_final_rate": None,
-                "hull_premium": None,
-                "tpl_base_rate": None,
-                "tpl_base_layer_premium": None,
-                "tpl_ilf": None,
-                "tpl_layer_premium": None
-            },
-            {
-                "serial_number": "AAA-123",
-                "value": 15000,
-                "weight": "5 - 10kg",
-                "has_detachable_camera": True,
-                "tpl_limit": 5000000, #set tpl_limit to its numerical value as this is an input variable
-                "tpl_excess": 5000000, #set tpl_excess to its numerical value as this is an input variable
-                "hull_base_rate": None,
-                "hull_weight_adjustment": None,
-                "hull_final_rate": None,
-                "hull_premium": None,
-                "tpl_base_rate": None,
-                "tpl_base_layer_premium": None,
-                "tpl_ilf": None,
-                "tpl_layer_premium": None
-            }
-        ],
-        "detachable_cameras": [
-            {
-                "serial_number": "ZZZ-999",
-                "value": 5000,
-                "hull_rate": None,
-                "hull_premium": None
-            },
-            {
-                "serial_number": "YYY-888",
-                "value": 2500,
-                "hull_rate": None,
-                "hull_premium": None
-            },
-            {
-                "serial_number": "XXX-777",
-                "value": 1500,
-                "hull_rate": None,
-                "hull_premium": None
-            },
-            {
-                "serial_number": "WWW-666",
-                "value": 2000,
-                "hull_rate": None,
-                "hull_premium": None
-            }
-
-        ],
-        "gross_prem": {
-            "drones_hull": None,
-            "drones_tpl": None,
-            "cameras_hull": None,
-            "total": None
+    serial_number: str
+    value: float
+    weight: str
+    has_detachable_camera: bool
+    tpl_limit: float
+    tpl_excess: float
+    hull_base_rate: float = 0.0
+    hull_weight_adjustment: float = 0.0
+    hull_final_rate: float = 0.0
+    hull_premium: float = 0.0
+    tpl_base_rate: float = 0.0
+    tpl_base_layer_premium: float = 0.0
+    tpl_ilf: float = 0.0
+    tpl_layer_premium: float = 0.0
+    adjusted_hull_premium: float = 0.0
+
+    def to_dict(self) -> dict:
+        """
+        Return the drone as a dictionary, in the same layout as the input data.
+        """
+        return asdict(self)
+
+
+#the pricing parameters rarely change between quotes, so the pricing function built
+#from them is cached (see make_pricer). frozen makes these hashable for the cache
+@dataclass(frozen=True, slots=True)
+class PricingParams:
+    """
+    The model parameters used to price a fleet of drones.
+    """
+    hull_base_rate: float
+    tpl_base_rate: float
+    base_limit: float
+    z: float
+    
+    def constants(self) -> tuple:
+        """
+        Return the hull_base_rate, tpl_base_rate, inv_base (1/base_limit) and ilf_power
+        (log2(1+z)) constants, in the order the pricing kernels take them.
+        """
+        return self.hull_base_rate, self.tpl_base_rate, 1.0/self.base_limit, math.log2(1+self.z)
+
+#define input data structure. This is built once when the module is imported and
+#get_example_data hands out copies of it. The outputs are added to each copy by main()
+#so there are no placeholder keys for them here
+_EXAMPLE_DATA = {
+    "insured": "Drones R Us",
+    "underwriter": "Michael",
+    "broker": "AON",
+    "brokerage": 0.3,
+    "max_drones_in_air": 2,
+    "drones": (
+        {
+            "serial_number": "AAA-111",
+            "value": 10000,
+            "weight": "0 - 5kg",
+            "has_detachable_camera": True,
+            "tpl_limit": 1000000, #set tpl_limit to its numerical value as this is an input variable
+            "tpl_excess": 0, #set tpl_excess to its numerical value as this is an input variable
+        },
+        {
+            "serial_number": "BBB-222",
+            "value": 12000,
+            "weight": "10 - 20kg",
+            "has_detachable_camera": False,
+            "tpl_limit": 4000000, #set tpl_limit to its numerical value as this is an input variable
+            "tpl_excess": 1000000, #set tpl_excess to its numerical value as this is an input variable
         },
-        "net_prem": {
-            "drones_hull": None,
-            "drones_tpl": None,
-            "cameras_hull": None,
-            "total": None
+        {
+            "serial_number": "AAA-123",
+            "value": 15000,
+            "weight": "5 - 10kg",
+            "has_detachable_camera": True,
+            "tpl_limit": 5000000, #set tpl_limit to its numerical value as this is an input variable
+            "tpl_excess": 5000000, #set tpl_excess to its numerical value as this is an input variable
         }
+    ),
+    "detachable_cameras": (
+        {
+            "serial_number": "ZZZ-999",
+            "value": 5000,
+        },
+        {
+            "serial_number": "YYY-888",
+            "value": 2500,
+        },
+        {
+            "serial_number": "XXX-777",
+            "value": 1500,
+        },
+        {
+            "serial_number": "WWW-666",
+            "value": 2000,
+        }
+    ),
+}
+
+def get_example_data():
+    """
+    Return a copy of the example input data for the drone pricing model, with the drones
+    as Drone objects and empty gross_prem and net_prem dictionaries for the outputs
+    """
+    #only the drones and camera dictionaries are changed by the model, so copying these
+    #is enough (and much quicker than copy.deepcopy)
+    example_data = {
+        **_EXAMPLE_DATA,
+        "drones": [Drone(**d) for d in _EXAMPLE_DATA['drones']],
+        "detachable_cameras": [dict(c) for c in _EXAMPLE_DATA['detachable_cameras']],
+        "gross_prem": {},
+        "net_prem": {},
     }
 
     return example_data
 
 # Validation functions
 
-def validate_drone(drone: dict):
+def validate_drone(drone: Drone):
     
-    #Checking all required data is available
+    #All required data is available as the Drone fields have to be given when it is created
     required = ['value','weight', 'tpl_limit', 'tpl_excess']
     
     for key in required:
-        if key not in drone:
-            raise KeyError(f"Missing Key '{key}' in drone data")
+        field = getattr(drone, key)
         
         #completing type checks which raise errors if weight is not
         #string tpye or if value, tpl_limit and tpl_excess are not numeric
         if key == 'weight': 
-            if not isinstance(drone[key], str):
+            if not isinstance(field, str):
                 raise TypeError("Drone field 'weight' must be a string")
         
         else:
-            if not isinstance(drone[key], (int, float)):
+            if not isinstance(field, (int, float)):
                 raise TypeError(f"Drone field '{key}' must be numeric")
                 
         #Field specific validation (confirm with hx)
-        if drone['value'] < 0:
+        if drone.value < 0:
             raise ValueError("Drone value must be positive")
 
+
+def validate_fleet(drones: list):
+    """
+    Run the validate_drone checks on the whole fleet at once. A fleet passes only if every
+    drone would pass validate_drone.
+    
+    Parameters:
+    drones = list of Drones
+    """
+    if not drones:
+        return
+    
+    #the type checks are the same isinstance tests as validate_drone, one value at a time,
+    #so anything validate_drone accepts or rejects (numpy scalars, bools, big ints) is
+    #treated the same way here. The fields are checked in the same order as validate_drone
+    values = [d.value for d in drones]
+    if not all(isinstance(v, (int, float)) for v in values):
+        raise TypeError("Drone field 'value' must be numeric")
+    #numpy is only used for the sign check over the whole fleet
+    if (np.array(values, dtype=np.float64) < 0).any():
+        raise ValueError("Drone value must be positive")
+    
+    if not all(isinstance(d.weight, str) for d in drones):
+        raise TypeError("Drone field 'weight' must be a string")
+    
+    for key in ['tpl_limit', 'tpl_excess']:
+        if not all(isinstance(getattr(d, key), (int, float)) for d in drones):
+            raise TypeError(f"Drone field '{key}' must be numeric")
+
 #Set up functions to be used in the main
 
-def ilf(x, base_limit, z) -> float:
+@_jit("float64(float64, float64, float64)")
+def ilf(x, inv_base, ilf_power) -> float:
     """
     Compute ILF(x).
     
     Parameters:
     x = the input eithet limit + excess or excess
-    base_limit = the base limit defined in the parameters given
-    z = the surcharged defined in the parameters given
+    inv_base = 1/base_limit, computed once by the caller so each call multiplies instead of divides
+    ilf_power = log2(1+z), computed once by the caller as z is the same for every drone
     """
-    ilf_core = (x/base_limit) 
-    ilf_power = math.log2(1+z)
+    ilf_core = x * inv_base
     ilfx = ilf_core ** ilf_power
     return ilfx
 
-def ilf_layer(limit, excess, base_limit, z) -> float:
+@_jit("float64(float64, float64, float64, float64)")
+def ilf_layer(limit, excess, inv_base, ilf_power) -> float:
     """
     Compute ILF layer.
     
     Parameters:
     limit = tpl_limit given in the input data
     excess = tpl_excess given in the input data
-    base_limit = the base limit defined in the parameters given
-    z = the surcharged defined in the parameters given
+    inv_base = 1/base_limit, computed once by the caller
+    ilf_power = log2(1+z), computed once by the caller
     """
     limit_excess = limit + excess
-    ilf_limit_excess = ilf(limit_excess, base_limit, z)
-    ilf_excess = ilf(excess, base_limit, z)
+    ilf_limit_excess = ilf(limit_excess, inv_base, ilf_power)
+    #the ILF of a zero excess is zero, so skip the power
+    ilf_excess = ilf(excess, inv_base, ilf_power) if excess > 0 else 0.0
     layer_ilf = ilf_limit_excess - ilf_excess
     return layer_ilf
 
+#price_drone prices one drone for the compiled fleet pricers (make_pricer, the price_fleets
+#gufunc and the AOT kernel in drone_kernel_build.py). _price_arrays is the same formula on
+#whole arrays for the numpy and JAX pricers
+@_jit("UniTuple(float64, 4)(float64, float64, float64, float64, float64, float64, float64, float64)")
+def price_drone(value, weight_adj, tpl_limit, tpl_excess,
+                hull_base_rate, tpl_base_rate, inv_base, ilf_power) -> tuple:
+    """
+    Compute the hull and TPL premiums for one drone.
+    
+    Parameters:
+    value = drone value
+    weight_adj = weight adjustment for the drone's weight
+    tpl_limit = tpl_limit given in the input data
+    tpl_excess = tpl_excess given in the input data
+    hull_base_rate = base rate provided in parameters
+    tpl_base_rate = base rate provided in parameters
+    inv_base = 1/base_limit
+    ilf_power = log2(1+z)
+    
+    Returns hull_final_rate, hull_premium, tpl_ilf and tpl_layer_premium
+    """
+    #hull premium
+    hull_final_rate = hull_base_rate * weight_adj
+    hull_premium = value * hull_final_rate
+    #tpl premium
+    tpl_ilf = ilf_layer(tpl_limit, tpl_excess, inv_base, ilf_power)
+    tpl_layer_premium = tpl_base_rate * value * tpl_ilf
+    return hull_final_rate, hull_premium, tpl_ilf, tpl_layer_premium
+
 # Firstly I will write the function calculate_hull_premium and then the function to 
 # calculate_tpl_premium. This will mirror section (1) in the main code below
 
-def calculate_hull_premium(drone: dict, hull_base_rate: float, weight_adj_table: dict) -> None:
+def calculate_hull_premium(drone: Drone, hull_base_rate: float, weight_adj_table: dict) -> None:
     """
     Compute Drone Hull Premium.
     
     Parameters:
-    drone = drone dictionaries from get_example_data
+    drone = Drone from get_example_data
     hull_base_rate = base rate provided in parameters
     weight_adj_table = table of drone weights and their corresponding weight adjustment values
     """
     #validate inputs
     validate_drone(drone)
     #add base rate
-    drone['hull_base_rate'] = hull_base_rate
+    drone.hull_base_rate = hull_base_rate
     #add weight adjustments by mapping from table
-    drone['hull_weight_adjustment'] = weight_adj_table.get(drone['weight'], 1)
+    drone.hull_weight_adjustment = weight_adj_table.get(drone.weight, 1)
     #calculate final rate
-    drone['hull_final_rate'] = drone['hull_base_rate'] * drone['hull_weight_adjustment']
+    drone.hull_final_rate = drone.hull_base_rate * drone.hull_weight_adjustment
     #calculate hull premium
-    drone['hull_premium'] = drone['value'] * drone['hull_final_rate']
+    drone.hull_premium = drone.value * drone.hull_final_rate
 
 
-def calculate_tpl_premium(drone: dict, tpl_base_rate: float, base_limit: float, z: float) -> None:
+def calculate_tpl_premium(drone: Drone, tpl_base_rate: float, inv_base: float, ilf_power: float) -> None:
     """
     Compute TPL Premium.
     
     Parameters:
-    drone = drone dictionaries from get_example_data
+    drone = Drone from get_example_data
     tpl_base_rate = base rate provided in parameters
-    base_limit = base_limit provided in parameters
-    z = z provided in parameters
+    inv_base = 1/base_limit, computed once by the caller as base_limit is the same for every drone
+    ilf_power = log2(1+z), computed once by the caller as z is the same for every drone
+    
+    The drone is not validated again here as calculate_hull_premium has already done this
     """
-    #validate inputs
-    validate_drone(drone)
     #add base rate
-    drone['tpl_base_rate'] = tpl_base_rate
+    drone.tpl_base_rate = tpl_base_rate
     #calculate tpl_base_layer_premium
-    drone['tpl_base_layer_premium'] = drone['tpl_base_rate'] * drone['value']
+    drone.tpl_base_layer_premium = drone.tpl_base_rate * drone.value
     #calculate ilf
-    drone['tpl_ilf'] = ilf_layer(drone['tpl_limit'],drone['tpl_excess'], base_limit, z)
+    drone.tpl_ilf = ilf_layer(drone.tpl_limit, drone.tpl_excess, inv_base, ilf_power)
     #calcualte tpl_layer_premium
-    drone['tpl_layer_premium'] = drone['tpl_base_layer_premium'] * drone['tpl_ilf']
+    drone.tpl_layer_premium = drone.tpl_base_layer_premium * drone.tpl_ilf
+        
+# The two functions above price one drone at a time. For a whole fleet the same
+# calculations are done on numpy arrays (one array per field) instead of looping
+# over the drones
+
+def _drones_to_arrays(drones: list, weight_adj_table: dict) -> dict:
+    """
+    Convert the list of drones into a dictionary of numpy arrays.
+    
+    Parameters:
+    drones = list of Drones
+    weight_adj_table = table of drone weights and their corresponding weight adjustment values
+    """
+    #encode the weights as small ints so the adjustment is an array index rather than a dict lookup.
+    #weights that aren't in the table get the last slot, which has the default adjustment of 1
+    weight_codes = {weight: i for i, weight in enumerate(weight_adj_table)}
+    unknown_weight = len(weight_codes)
+    
+    return {
+        "serial_number": np.array([d.serial_number for d in drones], dtype=str),
+        "values": np.array([d.value for d in drones], dtype=np.float64),
+        "weight_idx": np.fromiter((weight_codes.get(d.weight, unknown_weight) for d in drones),
+                                  dtype=np.int8, count=len(drones)),
+        "weight_adj": np.array([*weight_adj_table.values(), 1], dtype=np.float64),
+        "tpl_limit": np.array([d.tpl_limit for d in drones], dtype=np.float64),
+        "tpl_excess": np.array([d.tpl_excess for d in drones], dtype=np.float64),
+        "has_detachable_camera": np.fromiter((d.has_detachable_camera for d in drones),
+                                             dtype=bool, count=len(drones)),
+    }
+
+
+def _price_arrays(xp, values, weight_adj, tpl_limit, tpl_excess,
+                  hull_base_rate, tpl_base_rate, inv_base, ilf_power) -> tuple:
+    """
+    Compute the hull and TPL premiums for arrays of drones. This is price_drone on whole
+    arrays, written once for both numpy and jax.numpy.
+    
+    Parameters:
+    xp = the array module to use, numpy or jax.numpy
+    values = array of drone values
+    weight_adj = array of weight adjustments, one for each drone
+    tpl_limit = array of tpl limits
+    tpl_excess = array of tpl excesses
+    hull_base_rate, tpl_base_rate, inv_base, ilf_power = as for price_drone
+    
+    Returns hull_final_rate, hull_premium, tpl_ilf and tpl_layer_premium arrays
+    """
+    #hull premium
+    hull_final_rate = hull_base_rate * weight_adj
+    hull_premium = values * hull_final_rate
+    #tpl premium, the ILF of a zero excess is zero. Negative excesses are clipped before
+    #the power so numpy doesn't warn about them
+    ilf_le = ((tpl_limit + tpl_excess) * inv_base) ** ilf_power
+    ilf_ex = xp.where(tpl_excess > 0, (xp.maximum(tpl_excess, 0.0) * inv_base) ** ilf_power, 0.0)
+    tpl_ilf = ilf_le - ilf_ex
+    tpl_layer_premium = tpl_base_rate * values * tpl_ilf
+    return hull_final_rate, hull_premium, tpl_ilf, tpl_layer_premium
+
+
+def make_numpy_pricer(params: PricingParams):
+    """
+    Build the numpy version of the make_pricer pricing function, used when numba isn't installed.
+    
+    Parameters:
+    params = PricingParams for the quote
+    """
+    constants = params.constants()
+    
+    def price(values, weight_idx, weight_adj, tpl_limit, tpl_excess):
+        return _price_arrays(np, values, weight_adj[weight_idx], tpl_limit, tpl_excess, *constants)
+    
+    return price
+
+
+@lru_cache(maxsize=None)
+def make_pricer(params: PricingParams):
+    """
+    Build a fleet pricing function with the parameters fixed in it.
+    
+    log2(1+z) and 1/base_limit are worked out here by PricingParams.constants, once per set
+    of parameters, and the returned function treats them as constants. When numba is installed the function is
+    compiled, so the constants are folded into the machine code.
+    
+    Parameters:
+    params = PricingParams for the quote
+    
+    The returned function takes the values, weight_idx, weight_adj, tpl_limit and tpl_excess
+    arrays from _drones_to_arrays and returns the hull_final_rate, hull_premium, tpl_ilf and
+    tpl_layer_premium arrays
+    """
+    if njit is None:
+        return make_numpy_pricer(params)
+    
+    hull_base_rate, tpl_base_rate, inv_base, ilf_power = params.constants()
+    
+    #fastmath lets LLVM fuse the multiplies and vectorise the loop, and prange spreads
+    #the drones across threads
+    @njit(parallel=True, fastmath=True, cache=True)
+    def price(values, weight_idx, weight_adj, tpl_limit, tpl_excess):
+        n = values.shape[0]
+        hull_final_rate = np.empty(n)
+        hull_premium = np.empty(n)
+        tpl_ilf = np.empty(n)
+        tpl_layer_premium = np.empty(n)
+        
+        for i in prange(n):
+            hull_final_rate[i], hull_premium[i], tpl_ilf[i], tpl_layer_premium[i] = price_drone(
+                values[i], weight_adj[weight_idx[i]], tpl_limit[i], tpl_excess[i],
+                hull_base_rate, tpl_base_rate, inv_base, ilf_power)
         
+        return hull_final_rate, hull_premium, tpl_ilf, tpl_layer_premium
+    
+    return price
+
+
+def _price_fleet(arrays: dict, params: PricingParams) -> tuple:
+    """
+    Price one fleet with the AOT compiled drone_kernel if it has been built, otherwise
+    with make_pricer.
+    
+    Parameters:
+    arrays = arrays from _drones_to_arrays
+    params = PricingParams for the quote
+    
+    Returns the hull_final_rate, hull_premium, tpl_ilf and tpl_layer_premium arrays
+    """
+    if drone_kernel is not None:
+        return drone_kernel.price_fleet(arrays['values'], arrays['weight_idx'], arrays['tpl_limit'],
+                                        arrays['tpl_excess'], arrays['weight_adj'], *params.constants())
+    return make_pricer(params)(arrays['values'], arrays['weight_idx'], arrays['weight_adj'],
+                               arrays['tpl_limit'], arrays['tpl_excess'])
+
+
+def calculate_drone_premiums(drones: list, hull_base_rate: float, tpl_base_rate: float,
+                             weight_adj_table: dict, base_limit: float, z: float) -> dict:
+    """
+    Compute hull and TPL premiums for every drone in one vectorised pass.
+    
+    Returns the arrays from _drones_to_arrays with the calculated hull_final_rate,
+    hull_premium, tpl_ilf and tpl_layer_premium arrays added.
+    
+    The fleet is priced with the first of these that is available:
+    (1) the AOT compiled drone_kernel, if drone_kernel_build.py has been run. This always
+        takes priority, so the parallel fastmath JIT pricer below is not used when it is built
+    (2) the make_pricer numba JIT pricer (parallel, fastmath, cached to disk) if numba is installed
+    (3) the make_pricer numpy pricer
+    
+    Parameters:
+    drones = list of Drones
+    hull_base_rate = base rate provided in parameters
+    tpl_base_rate = base rate provided in parameters
+    weight_adj_table = table of drone weights and their corresponding weight adjustment values
+    base_limit = base_limit provided in parameters
+    z = z provided in parameters
+    """
+    arrays = _drones_to_arrays(drones, weight_adj_table)
+    values = arrays['values']
+    weight_idx = arrays['weight_idx']
+    weight_adj = arrays['weight_adj']
+    
+    hull_final_rate, hull_premium, tpl_ilf, tpl_layer_premium = _price_fleet(
+        arrays, PricingParams(hull_base_rate, tpl_base_rate, base_limit, z))
+    
+    adj = weight_adj[weight_idx]
+    tpl_base_layer_premium = tpl_base_rate * values
+    
+    #write results back into the drones in one pass
+    for drone, w_adj, hfr, hp, tblp, t_ilf, tlp in zip(
+            drones, adj.tolist(), hull_final_rate.tolist(), hull_premium.tolist(),
+            tpl_base_layer_premium.tolist(), tpl_ilf.tolist(), tpl_layer_premium.tolist()):
+        drone.hull_base_rate = hull_base_rate
+        drone.hull_weight_adjustment = w_adj
+        drone.hull_final_rate = hfr
+        drone.hull_premium = hp
+        drone.tpl_base_rate = tpl_base_rate
+        drone.tpl_base_layer_premium = tblp
+        drone.tpl_ilf = t_ilf
+        drone.tpl_layer_premium = tlp
+    
+    arrays.update(hull_final_rate=hull_final_rate, hull_premium=hull_premium,
+                  tpl_ilf=tpl_ilf, tpl_layer_premium=tpl_layer_premium)
+    return arrays
+
+# For batch re-rating many fleets are priced with one call to a numba generalised ufunc,
+# which runs the fleets in parallel threads
+
+@lru_cache(maxsize=None)
+def _batch_kernel():
+    """
+    Build the generalised ufunc used by price_fleets. This is done on first use rather than
+    at import as guvectorize compiles straight away.
+    """
+    @guvectorize(["void(float64[:], int8[:], float64[:], float64[:], float64[:], "
+                  "float64, float64, float64, float64, float64[:], float64[:])"],
+                 "(n),(n),(m),(n),(n),(),(),(),()->(n),(n)", target='parallel', fastmath=True)
+    def kernel(values, weight_idx, weight_adj, tpl_limit, tpl_excess,
+               hull_base_rate, tpl_base_rate, inv_base, ilf_power, hull_premium, tpl_layer_premium):
+        for i in range(values.shape[0]):
+            _, hull_premium[i], _, tpl_layer_premium[i] = price_drone(
+                values[i], weight_adj[weight_idx[i]], tpl_limit[i], tpl_excess[i],
+                hull_base_rate, tpl_base_rate, inv_base, ilf_power)
+    
+    return kernel
+
+
+@lru_cache(maxsize=None)
+def make_jax_pricer(params: PricingParams):
+    """
+    Build a JAX compiled pricing function for a batch of fleets with the parameters fixed in it.
+    jax is imported here rather than at the top of the file as it is slow to import.
+    
+    Parameters:
+    params = PricingParams for the batch
+    
+    The returned function takes 2D values, weight_idx, tpl_limit and tpl_excess arrays (one row
+    per fleet) and the weight_adj array, and returns 2D hull_premium and tpl_layer_premium numpy
+    arrays. It runs JAX in 64 bit mode only for the duration of the call, so the ordinary JAX
+    default (float32) is left alone for any other JAX code in the process
+    """
+    import jax
+    import jax.numpy as jnp
+    
+    #JAX works in float32 unless told otherwise, which isn't accurate enough for premiums.
+    #Newer JAX has the enable_x64 context manager at the top level, older JAX in experimental
+    enable_x64 = getattr(jax, 'enable_x64', None)
+    if enable_x64 is None:
+        from jax.experimental import enable_x64
+    
+    constants = params.constants()
+    
+    def price(values, weight_idx, weight_adj, tpl_limit, tpl_excess):
+        _, hull_premium, _, tpl_layer_premium = _price_arrays(
+            jnp, values, weight_adj[weight_idx], tpl_limit, tpl_excess, *constants)
+        return hull_premium, tpl_layer_premium
+    
+    #vmap maps price over the fleets (rows), sharing the weight_adj array
+    price_batch = jax.jit(jax.vmap(price, in_axes=(0, 0, None, 0, 0)))
+    
+    def price_x64(values, weight_idx, weight_adj, tpl_limit, tpl_excess):
+        with enable_x64(True):
+            hull_premium, tpl_layer_premium = price_batch(values, weight_idx, weight_adj,
+                                                          tpl_limit, tpl_excess)
+            return np.asarray(hull_premium), np.asarray(tpl_layer_premium)
+    
+    return price_x64
+
+
+def _stack_fleets(fleet_arrays: list):
+    """
+    Stack the arrays of each fleet into 2D arrays with one row per fleet. Shorter fleets are
+    padded with zero value drones, which price to zero.
+    
+    Parameters:
+    fleet_arrays = list of arrays from _drones_to_arrays, one for each fleet
+    
+    Returns the fleet lengths and the values, weight_idx, tpl_limit and tpl_excess 2D arrays
+    """
+    lengths = [a['values'].size for a in fleet_arrays]
+    shape = (len(fleet_arrays), max(lengths))
+    values = np.zeros(shape)
+    weight_idx = np.zeros(shape, dtype=np.int8)
+    tpl_limit = np.zeros(shape)
+    tpl_excess = np.zeros(shape)
+    for i, (a, n) in enumerate(zip(fleet_arrays, lengths)):
+        values[i, :n] = a['values']
+        weight_idx[i, :n] = a['weight_idx']
+        tpl_limit[i, :n] = a['tpl_limit']
+        tpl_excess[i, :n] = a['tpl_excess']
+    return lengths, values, weight_idx, tpl_limit, tpl_excess
+
+
+def price_fleets(fleets: list, weight_adj_table: dict, params: PricingParams) -> list:
+    """
+    Compute hull and TPL premiums for many fleets at once, e.g. for a batch re-rate.
+    The drones are not changed.
+    
+    Parameters:
+    fleets = list of fleets, each a list of Drones
+    weight_adj_table = table of drone weights and their corresponding weight adjustment values
+    params = PricingParams used for every fleet
+    
+    The fleets are priced with JAX if USE_JAX is set, otherwise with numba. If drone_kernel
+    has been built, or numba isn't installed, they are priced one fleet at a time with
+    _price_fleet instead.
+    
+    Returns a (hull_premium, tpl_layer_premium) pair of arrays for each fleet
+    """
+    fleet_arrays = [_drones_to_arrays(drones, weight_adj_table) for drones in fleets]
+    
+    if not fleets:
+        return []
+    
+    if USE_JAX:
+        lengths, values, weight_idx, tpl_limit, tpl_excess = _stack_fleets(fleet_arrays)
+        hull_premium, tpl_layer_premium = make_jax_pricer(params)(
+            values, weight_idx, fleet_arrays[0]['weight_adj'], tpl_limit, tpl_excess)
+        return [(hull_premium[i, :n], tpl_layer_premium[i, :n]) for i, n in enumerate(lengths)]
+    
+    if njit is None:
+        results = []
+        for a in fleet_arrays:
+            _, hull_premium, _, tpl_layer_premium = _price_fleet(a, params)
+            results.append((hull_premium, tpl_layer_premium))
+        return results
+    
+    #the padding is sliced off the results
+    lengths, values, weight_idx, tpl_limit, tpl_excess = _stack_fleets(fleet_arrays)
+    hull_premium, tpl_layer_premium = _batch_kernel()(
+        values, weight_idx, fleet_arrays[0]['weight_adj'], tpl_limit, tpl_excess, *params.constants())
+    return [(hull_premium[i, :n], tpl_layer_premium[i, :n]) for i, n in enumerate(lengths)]
+
 # Now I will write a function for calculating section 2 in the main code below which relates
 # to calculating camera premiums
 
 
-def get_max_hull_rate(drones: list) -> float:
+def get_max_hull_rate(hull_final_rate, has_detachable_camera) -> float:
     """
-    Loop through the list of dictionaries and identify the max hull rate for drones that have detachable cameras.
+    Identify the max hull rate for drones that have detachable cameras, or 0 if no drone has one.
     
     Parameters:
-    drones = list of drone dictionaries
-    """
-    max_rate = None
-    for d in drones:
-        if d['has_detachable_camera'] == True:
-            if max_rate is None or d['hull_final_rate'] > max_rate:
-                max_rate = d['hull_final_rate']
-    return max_rate
+    hull_final_rate = array of drone hull final rates
+    has_detachable_camera = boolean array, True for drones that have detachable cameras
+    """
+    if not has_detachable_camera.any():
+        return 0.0
+    return float(hull_final_rate[has_detachable_camera].max())
             
 
 def calculate_camera_premium(detachable_cameras: list, max_hull_rate: float) -> None:
@@ -251,50 +674,111 @@ def calculate_camera_premium(detachable_cameras: list, max_hull_rate: float) ->
     
     Parameters:
     detachable_cameras = list of camera dictionaries
+    max_hull_rate = rate charged for every camera, from get_max_hull_rate
     """
-    for camera in detachable_cameras:
+    #every camera has the same rate so the premiums are one broadcast multiply
+    cam_values = np.fromiter((c['value'] for c in detachable_cameras), dtype=np.float64,
+                             count=len(detachable_cameras))
+    cam_hull_premium = cam_values * max_hull_rate
+    
+    for camera, premium in zip(detachable_cameras, cam_hull_premium.tolist()):
         camera['hull_rate'] = max_hull_rate
-        camera['hull_premium'] = camera['value'] * camera['hull_rate']
+        camera['hull_premium'] = premium
 
 
 # Now I will write a function for section 3 in the main code - applying extensions
 
-def applying_extensions(data: dict) -> None:
+def _keep_top_n(premiums, ranking, n: int, flat_rate: float):
+    """
+    Keep the premium for the n items ranked highest and charge a flat rate for the rest.
+    
+    Parameters:
+    premiums = array of premiums
+    ranking = array of values used to rank the items, highest first
+    n = number of items charged the full premium
+    flat_rate = premium charged for all other items
+    """
+    #match the old sorted loop, which charged the full premium while the rank i < n: a
+    #fractional n keeps ceil(n) items, n above the number of items keeps them all and a
+    #negative n charges everything the flat rate. This also makes n an int for argpartition
+    n = max(math.ceil(min(n, premiums.size)), 0)
+    adjusted = np.full(premiums.size, flat_rate, dtype=np.float64)
+    if premiums.size > n:
+        #argpartition only finds the top n rather than sorting everything
+        top = np.argpartition(-ranking, n)[:n]
+    else:
+        top = slice(None)
+    adjusted[top] = premiums[top]
+    return adjusted
+
+
+def applying_extensions(data: dict) -> tuple:
     """
     Implement the extensions provided in the word document provided by HX.
     
     Parameters:
     data = full data dictionary
+    
+    Returns the adjusted hull premium arrays for the drones and for the cameras
     """
     
     max_drones = data['max_drones_in_air']
+    drones = data['drones']
+    cameras = data['detachable_cameras']
     
-    #sort values based on hull premiums
-    sorted_drones = sorted(data['drones'], key = lambda d: d['hull_premium'], reverse=True)
-    #now loop through sorted_drones keeping highest premiums for n drones and setting rest to 50
-    for i, drone in enumerate(sorted_drones): #enumerate adds a index to the iterable list so we can do anything >= 2 ==150
-        if i >= max_drones:
-            drone['adjusted_hull_premium'] = 150 #flat rate
-        else:
-            drone['adjusted_hull_premium'] = drone['hull_premium']
+    # (3)(i) keep the highest premiums for n drones and set the rest to a flat rate of 150
+    hull_premiums = np.fromiter((d.hull_premium for d in drones), dtype=np.float64, count=len(drones))
+    adjusted = _keep_top_n(hull_premiums, hull_premiums, max_drones, 150.0)
+    for drone, adj_prem in zip(drones, adjusted.tolist()):
+        drone.adjusted_hull_premium = adj_prem
             
     # (3)(ii) Applying the extensions for cameras. 
-    #If there is more cameras than drones charge the full rate for n camers     with the highest values
+    #If there is more cameras than drones charge the full rate for n cameras with the highest values
     # and charge a flat rate for the remaning n of 50
     #first identify if there are more cameras than drones
-    if len(data['detachable_cameras']) > len(data['drones']):
-        sorted_cameras = sorted(data['detachable_cameras'], key = lambda c: c['value'], reverse = True)
-        for i, cam in enumerate(sorted_cameras):
-            if i >= max_drones:
-                cam['adjusted_hull_premium'] = 50
-            else:
-                cam['adjusted_hull_premium'] = cam['hull_premium']
-    
+    cam_premiums = np.fromiter((c['hull_premium'] for c in cameras), dtype=np.float64, count=len(cameras))
+    if len(cameras) > len(drones):
+        cam_values = np.fromiter((c['value'] for c in cameras), dtype=np.float64, count=len(cameras))
+        cam_adjusted = _keep_top_n(cam_premiums, cam_values, max_drones, 50.0)
     else:
-        for cam in data['detachable_cameras']:
-            cam['adjusted_hull_premium'] = cam['hull_premium']
+        cam_adjusted = cam_premiums
+    for cam, adj_prem in zip(cameras, cam_adjusted.tolist()):
+        cam['adjusted_hull_premium'] = adj_prem
+    
+    return adjusted, cam_adjusted
             
 
+# Output functions
+
+def fleet_results(drone_arrays: dict, adjusted_hull_premium) -> np.recarray:
+    """
+    Return the per-drone premiums as a numpy record array, one record per drone, so they
+    can be summed, filtered or exported without walking the data dictionary.
+    main stores this in data['fleet_results'].
+    
+    Parameters:
+    drone_arrays = arrays returned by calculate_drone_premiums
+    adjusted_hull_premium = array of drone adjusted hull premiums from applying_extensions
+    """
+    return np.rec.fromarrays(
+        [drone_arrays['serial_number'], drone_arrays['hull_premium'],
+         drone_arrays['tpl_layer_premium'], adjusted_hull_premium],
+        names=['serial_number', 'hull_premium', 'tpl_layer_premium', 'adjusted_hull_premium'])
+
+
+def to_legacy_dict(data: dict) -> dict:
+    """
+    Return the model output in the original all-dictionary layout, with each drone as a dictionary
+    and without the fleet_results record array.
+    
+    Parameters:
+    data = full data dictionary returned by main
+    """
+    legacy = {key: value for key, value in data.items() if key != 'fleet_results'}
+    legacy['drones'] = [d.to_dict() for d in data['drones']]
+    return legacy
+
+
 def main():
     # 
     data = get_example_data()
@@ -313,37 +797,41 @@ def main():
     
     # (1) Calculating drone hull + tpl premiums
     
-    for drone in data['drones']:
-        calculate_hull_premium(drone, hull_base_rate, weight_adj_table)
-        calculate_tpl_premium(drone, tpl_base_rate, base_limit, z)
+    #validate the whole fleet once before pricing
+    validate_fleet(data['drones'])
+    drone_arrays = calculate_drone_premiums(data['drones'], hull_base_rate, tpl_base_rate,
+                                            weight_adj_table, base_limit, z)
           
     
     # (2) Calculating camera premiums
     
-    max_rate = get_max_hull_rate(data['drones'])
+    max_rate = get_max_hull_rate(drone_arrays['hull_final_rate'], drone_arrays['has_detachable_camera'])
     calculate_camera_premium(data['detachable_cameras'], max_rate)
     
   
     # (3) Applying extensions
         
-    applying_extensions(data)
+    drone_adjusted, camera_adjusted = applying_extensions(data)
+    data['fleet_results'] = fleet_results(drone_arrays, drone_adjusted)
             
     
     # (4) Calculating net and gross premiums
         
-    #sum together net premiums
-    data['net_prem']['drones_hull'] = sum(d['adjusted_hull_premium'] for d in data['drones'])
-    data['net_prem']['drones_tpl'] = sum(d['tpl_layer_premium'] for d in data['drones'])
-    data['net_prem']['cameras_hull'] =  sum(c['adjusted_hull_premium'] for c in data['detachable_cameras'])
-    data['net_prem']['total'] = data['net_prem']['drones_hull'] + data['net_prem']['drones_tpl'] +data['net_prem']['cameras_hull']
+    #sum together net premiums from the arrays, net = [drones_hull, drones_tpl, cameras_hull]
+    results = data['fleet_results']
+    net = np.array([results.adjusted_hull_premium.sum(), results.tpl_layer_premium.sum(),
+                    camera_adjusted.sum()])
+    
+    data['net_prem']['drones_hull'], data['net_prem']['drones_tpl'], data['net_prem']['cameras_hull'] = net.tolist()
+    data['net_prem']['total'] = float(net.sum())
     
     #calculate gross premiums
-    brokerage = data['brokerage']
+    #work out 1/(1-brokerage) once and multiply by it rather than dividing each net premium
+    inv_net_share = 1.0 / (1.0 - data['brokerage'])
+    gross = net * inv_net_share
     
-    data['gross_prem']['drones_hull'] = data['net_prem']['drones_hull'] / (1-brokerage)
-    data['gross_prem']['drones_tpl'] = data['net_prem']['drones_tpl'] / (1-brokerage)
-    data['gross_prem']['cameras_hull'] = data['net_prem']['cameras_hull'] / (1-brokerage)
-    data['gross_prem']['total'] = data['gross_prem']['drones_hull'] + data['gross_prem']['drones_tpl'] + data['gross_prem']['cameras_hull']
+    data['gross_prem']['drones_hull'], data['gross_prem']['drones_tpl'], data['gross_prem']['cameras_hull'] = gross.tolist()
+    data['gross_prem']['total'] = float(gross.sum())
     
     
     return data
@@ -351,8 +839,14 @@ def main():
 # Execute model and print results
                                                                                                        
 if __name__ == "__main__":
-    result = main()
-    pprint.pprint(result)
+    result = to_legacy_dict(main())
+    #pprint walks and sorts every dictionary in python, so it is only used when asked for.
+    #json.dumps is implemented in C and much quicker for large fleets
+    if '-v' in sys.argv or '--verbose' in sys.argv:
+        import pprint
+        pprint.pprint(result)
+    else:
+        sys.stdout.write(json.dumps(result, default=float) + "\n")
                                                                                                        
 
 
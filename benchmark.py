@@ -0,0 +1,61 @@
+"""
+Drone Pricing Benchmark
+-----------------------
+Author: Andrew Todd
+Description:
+    Times batch re-rating with price_fleets using the numba backend and the
+    JAX backend on randomly generated fleets. The first call of each backend
+    is run before timing so compile time is not included.
+
+    Before timing, it runs check_model.check_backends on the fleets, so it stops
+    with an error if any backend disagrees with make_pricer.
+
+    Run with:
+        python benchmark.py [num_fleets] [drones_per_fleet]
+"""
+
+import sys
+import timeit
+
+import Updated_Code as model
+from check_model import WEIGHT_ADJ_TABLE, check_backends, make_fleets
+
+
+def time_backend(fleets: list, weight_adj_table: dict, params, use_jax: bool, number: int = 5) -> float:
+    """
+    Return the best time in seconds of pricing all of the fleets with one backend.
+
+    Parameters:
+    fleets = list of fleets, each a list of Drones
+    weight_adj_table = table of drone weights and their corresponding weight adjustment values
+    params = PricingParams used for every fleet
+    use_jax = price with JAX if True, otherwise with numba
+    number = number of timed runs
+    """
+    model.USE_JAX = use_jax
+    #warm up so compile time isn't counted
+    model.price_fleets(fleets, weight_adj_table, params)
+    return min(timeit.repeat(lambda: model.price_fleets(fleets, weight_adj_table, params),
+                             number=1, repeat=number))
+
+
+def main():
+    num_fleets = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    drones_per_fleet = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    weight_adj_table = WEIGHT_ADJ_TABLE
+    params = model.PricingParams(hull_base_rate=0.06, tpl_base_rate=0.02, base_limit=1000000, z=0.2)
+    fleets = make_fleets(num_fleets, drones_per_fleet)
+
+    check_backends(fleets, weight_adj_table, params)
+    print("all backends agree with make_pricer")
+    print(f"{num_fleets} fleets x {drones_per_fleet} drones")
+    print(f"numba: {time_backend(fleets, weight_adj_table, params, use_jax=False):.4f}s")
+    try:
+        print(f"jax:   {time_backend(fleets, weight_adj_table, params, use_jax=True):.4f}s")
+    except ImportError:
+        print("jax:   not installed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Drone Pricing Checks
+--------------------
+Author: Andrew Todd
+Description:
+    Checks that validate_fleet accepts and rejects the same drones as
+    validate_drone, and that every pricing backend (the numpy fallback, the AOT kernel if it
+    has been built, and price_fleets with numba and with JAX if installed) gives
+    the same premiums as make_pricer, for several sets of pricing parameters.
+    Stops with an error if any of them disagree.
+
+    Run with:
+        python check_model.py
+"""
+
+import numpy as np
+
+import Updated_Code as model
+
+#pricing parameters to check, including z = 0 where every ILF is 1
+PARAM_SETS = [
+    model.PricingParams(hull_base_rate=0.06, tpl_base_rate=0.02, base_limit=1000000, z=0.2),
+    model.PricingParams(hull_base_rate=0.1, tpl_base_rate=0.05, base_limit=500000, z=0.5),
+    model.PricingParams(hull_base_rate=0.03, tpl_base_rate=0.01, base_limit=2500000, z=1.0),
+    model.PricingParams(hull_base_rate=0.06, tpl_base_rate=0.02, base_limit=1000000, z=0.0),
+]
+
+WEIGHT_ADJ_TABLE = {"0 - 5kg": 1, "5 - 10kg": 1.2, "10 - 20kg": 1.6, "> 20kg": 2.5}
+
+
+def make_fleets(num_fleets: int, drones_per_fleet: int, seed: int = 0) -> list:
+    """
+    Return num_fleets random fleets of drones_per_fleet Drones each.
+
+    Parameters:
+    num_fleets = number of fleets
+    drones_per_fleet = number of drones in each fleet
+    seed = random seed so runs are repeatable
+    """
+    rng = np.random.default_rng(seed)
+    weights = ["0 - 5kg", "5 - 10kg", "10 - 20kg", "> 20kg"]
+    return [
+        [model.Drone(serial_number=f"{f}-{i}",
+                     value=float(rng.integers(1000, 20000)),
+                     weight=weights[rng.integers(len(weights))],
+                     has_detachable_camera=bool(rng.integers(2)),
+                     tpl_limit=float(rng.integers(1, 6) * 1000000),
+                     tpl_excess=float(rng.integers(0, 6) * 1000000))
+         for i in range(drones_per_fleet)]
+        for f in range(num_fleets)
+    ]
+
+
+def _check_agree(name: str, results: list, expected: list) -> None:
+    """
+    Raise a ValueError if any array in results differs from the matching array in expected.
+
+    Parameters:
+    name = name of the backend, used in the error message
+    results = list of tuples of arrays from the backend, one for each fleet
+    expected = list of tuples of arrays from make_pricer, one for each fleet
+    """
+    for result, exp in zip(results, expected):
+        if not all(np.allclose(r, e, rtol=1e-12, atol=0) for r, e in zip(result, exp)):
+            raise ValueError(f"{name} prices disagree with make_pricer")
+
+
+def check_backends(fleets: list, weight_adj_table: dict, params) -> None:
+    """
+    Check that every pricing backend agrees with make_pricer for each fleet.
+
+    Parameters:
+    fleets = list of fleets, each a list of Drones
+    weight_adj_table = table of drone weights and their corresponding weight adjustment values
+    params = PricingParams used for every fleet
+    """
+    fleet_arrays = [model._drones_to_arrays(drones, weight_adj_table) for drones in fleets]
+    args = [(a['values'], a['weight_idx'], a['weight_adj'], a['tpl_limit'], a['tpl_excess'])
+            for a in fleet_arrays]
+    expected = [model.make_pricer(params)(*a) for a in args]
+    expected_pairs = [(hull_premium, tpl_layer_premium) for _, hull_premium, _, tpl_layer_premium in expected]
+
+    backends = {"numpy": [model.make_numpy_pricer(params)(*a) for a in args]}
+    if model.drone_kernel is not None:
+        backends["aot"] = [
+            model.drone_kernel.price_fleet(values, weight_idx, tpl_limit, tpl_excess, weight_adj,
+                                           *params.constants())
+            for values, weight_idx, weight_adj, tpl_limit, tpl_excess in args]
+    for name, results in backends.items():
+        _check_agree(name, results, expected)
+
+    use_jax = model.USE_JAX
+    try:
+        for jax_backend in (False, True):
+            model.USE_JAX = jax_backend
+            name = "price_fleets (jax)" if jax_backend else "price_fleets (numba)"
+            try:
+                results = model.price_fleets(fleets, weight_adj_table, params)
+            except ImportError:
+                continue
+            _check_agree(name, results, expected_pairs)
+    finally:
+        model.USE_JAX = use_jax
+
+
+#values for each field to give to both validators, valid and invalid
+VALIDATOR_INPUTS = [
+    1000, 1000.0, 0, -1, -0.5, True, False, 2**70, np.float64(1000), np.float64(-1),
+    np.int64(5), np.int32(5), np.float32(5), np.bool_(True), np.array(5.0), complex(1, 0),
+    [1000], None, "1000", "0 - 5kg", np.str_("0 - 5kg"),
+]
+
+
+def _validation_error(validate, drones: list):
+    """
+    Return the type of error validate raises for drones, or None if it doesn't raise one.
+
+    Parameters:
+    validate = validate_fleet, or a function running validate_drone on each drone
+    drones = list of Drones
+    """
+    try:
+        validate(drones)
+    except (TypeError, ValueError) as error:
+        return type(error)
+    return None
+
+
+def check_validators() -> None:
+    """
+    Check that validate_fleet accepts and rejects the same drones as validate_drone, by
+    putting each of VALIDATOR_INPUTS in each field of a valid drone in turn.
+    """
+    def validate_each(drones):
+        for drone in drones:
+            model.validate_drone(drone)
+
+    for key in ['value', 'weight', 'tpl_limit', 'tpl_excess']:
+        for field in VALIDATOR_INPUTS:
+            drones = make_fleets(1, 3)[0]
+            setattr(drones[1], key, field)
+            expected = _validation_error(validate_each, drones)
+            result = _validation_error(model.validate_fleet, drones)
+            if result != expected:
+                raise ValueError(f"validate_fleet gives {result} for {key} = {field!r}, "
+                                 f"validate_drone gives {expected}")
+
+
+def main():
+    check_validators()
+    print("validate_fleet agrees with validate_drone")
+    #the last fleet is shorter than the others so price_fleets has to pad it
+    fleets = make_fleets(5, 50) + make_fleets(1, 7, seed=1)
+    for params in PARAM_SETS:
+        check_backends(fleets, WEIGHT_ADJ_TABLE, params)
+    print(f"all backends agree with make_pricer for {len(PARAM_SETS)} parameter sets")
+
+
+if __name__ == "__main__":
+    main()
@@ -249,10 +249,16 @@ def main():
 
 # Execute model and print results
 if __name__ == "__main__":
-    import pprint
+    import sys
     import math
     result = main()
-    pprint.pprint(result)
+    #only pretty print when asked for with -v, json.dumps is much quicker for large fleets
+    if '-v' in sys.argv or '--verbose' in sys.argv:
+        import pprint
+        pprint.pprint(result)
+    else:
+        import json
+        sys.stdout.write(json.dumps(result, default=float) + "\n")
 
 
 # #### The output from this algorithm shows all of the input and the calculated values in the same data structure. It initially runs through the provided values and updates the drone and camera values that are associated with calculating premiums and also calculates the premiums of each device. The code initially updates the drone hull information by adding in and calculating the following hull premium information: 
@@ -0,0 +1,63 @@
+"""
+Drone Pricing Kernel
+--------------------
+Author: Andrew Todd
+Description:
+    Ahead of time (AOT) build of the fleet pricing kernel used by Updated_Code.py.
+    Compiling the kernel in advance means quoting does not pay numba's JIT
+    compile time on the first call.
+
+    Run this script once to build the drone_kernel extension module next to
+    this file:
+        python drone_kernel_build.py
+"""
+
+import sys
+
+import numpy as np
+from numba.pycc import CC
+
+#Updated_Code doesn't import numba once drone_kernel is built, so hide any kernel from an
+#earlier build while importing it. That way price_drone is compiled and can be called here
+sys.modules['drone_kernel'] = None
+from Updated_Code import price_drone
+
+cc = CC('drone_kernel')
+
+
+@cc.export('price_fleet',
+           'Tuple((f8[:], f8[:], f8[:], f8[:]))(f8[:], i1[:], f8[:], f8[:], f8[:], f8, f8, f8, f8)')
+def price_fleet(values, weight_idx, tpl_limit, tpl_excess, weight_adj,
+                hull_base_rate, tpl_base_rate, inv_base, ilf_power):
+    """
+    Compute hull and TPL premiums for every drone in the fleet.
+
+    Parameters:
+    values = array of drone values
+    weight_idx = array of weight codes, used to index weight_adj
+    tpl_limit = array of tpl limits
+    tpl_excess = array of tpl excesses
+    weight_adj = array of weight adjustments
+    hull_base_rate = base rate provided in parameters
+    tpl_base_rate = base rate provided in parameters
+    inv_base = 1/base_limit
+    ilf_power = log2(1+z)
+
+    Returns hull_final_rate, hull_premium, tpl_ilf and tpl_layer_premium arrays.
+    """
+    n = values.shape[0]
+    hull_final_rate = np.empty(n)
+    hull_premium = np.empty(n)
+    tpl_ilf = np.empty(n)
+    tpl_layer_premium = np.empty(n)
+
+    for i in range(n):
+        hull_final_rate[i], hull_premium[i], tpl_ilf[i], tpl_layer_premium[i] = price_drone(
+            values[i], weight_adj[weight_idx[i]], tpl_limit[i], tpl_excess[i],
+            hull_base_rate, tpl_base_rate, inv_base, ilf_power)
+
+    return hull_final_rate, hull_premium, tpl_ilf, tpl_layer_premium
+
+
+if __name__ == "__main__":
+    cc.compile()